@@ -50,9 +50,17 @@ What is the first frequency your device reaches twice?
 
 
 """
-from typing import List, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Iterable, List, Iterator, NamedTuple, Optional, Union
+import io
+import os
+import sys
+import tempfile
+import time
 import numpy as np
 
+CHUNK_SIZE = 1 << 20
+
 
 def resulting_frequency(list_freqs: List[int]) -> int:
     return np.sum(list_freqs)
@@ -62,8 +70,98 @@ assert resulting_frequency([+1, +1, +1]) == 3
 assert resulting_frequency([+1, +1, -2]) == 0
 assert resulting_frequency([-1, -2, -3]) == -6
 
-part1 = np.loadtxt("data/day01_part1.txt", dtype=int)
-print(resulting_frequency(part1))
+
+def read_drifts(source: Union[str, BinaryIO],
+                chunk_size: int = CHUNK_SIZE) -> Iterator[np.ndarray]:
+    """
+    Parse a drift list in fixed-size byte chunks.
+
+    Parameters
+    ----------
+    source : Union[str, BinaryIO]
+        Path to the drift list, "-" for stdin, or an open file / pipe
+    chunk_size : int, optional
+        Number of bytes read at a time (the default is CHUNK_SIZE)
+
+    Returns
+    -------
+    Iterator[np.ndarray]
+        One int64 array of drifts per chunk
+    """
+    if source == "-":
+        source = sys.stdin
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            yield from read_drifts(f, chunk_size)
+        return
+    # text streams (e.g. sys.stdin) expose their bytes through .buffer
+    stream = getattr(source, "buffer", source)
+    tail = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        chunk = tail + chunk
+        tokens = chunk.split()
+        # the last token may continue in the next chunk
+        tail = b"" if chunk[-1:].isspace() else tokens.pop()
+        if tokens:
+            yield np.array(tokens).astype(np.int64)
+    if tail:
+        yield np.array([tail]).astype(np.int64)
+
+
+def running_frequencies(source: Union[str, BinaryIO],
+                        chunk_size: int = CHUNK_SIZE) -> Iterator[np.ndarray]:
+    """
+    Stream the frequencies reached during one pass over a drift list.
+
+    Parameters
+    ----------
+    source : Union[str, BinaryIO]
+        Path to the drift list, "-" for stdin, or an open file / pipe
+    chunk_size : int, optional
+        Number of bytes read at a time (the default is CHUNK_SIZE)
+
+    Returns
+    -------
+    Iterator[np.ndarray]
+        Running frequencies, one array per chunk
+    """
+    current = 0
+    for drifts in read_drifts(source, chunk_size):
+        frequencies = np.cumsum(drifts) + current
+        current = int(frequencies[-1])
+        yield frequencies
+
+
+def resulting_frequency_streaming(source: Union[str, BinaryIO],
+                                  chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Sum a drift list of any size in constant memory.
+
+    Parameters
+    ----------
+    source : Union[str, BinaryIO]
+        Path to the drift list, "-" for stdin, or an open file / pipe
+    chunk_size : int, optional
+        Number of bytes read at a time (the default is CHUNK_SIZE)
+
+    Returns
+    -------
+    int
+        The resulting frequency
+    """
+    return sum(int(drifts.sum()) for drifts in read_drifts(source, chunk_size))
+
+
+assert resulting_frequency_streaming(io.BytesIO(b"+1\n+1\n+1\n")) == 3
+assert resulting_frequency_streaming(io.BytesIO(b"+1\n+1\n-2"), 2) == 0
+assert resulting_frequency_streaming(io.BytesIO(b"-1\n-22\n-3\n"), 3) == -26
+assert resulting_frequency_streaming(io.BytesIO(b"")) == 0
+assert list(np.concatenate(list(
+    running_frequencies(io.BytesIO(b"+3\n+3\n+4\n-2\n-4\n"), 4)
+))) == [3, 6, 10, 8, 4]
 
 
 def freqs_iterator(list_freqs: List[int]) -> Iterator:
@@ -101,4 +199,206 @@ assert first_repeated([+3, +3, +4, -2, -4]) == 10
 assert first_repeated([-6, +3, +8, +5, -6]) == 5
 assert first_repeated([+7, +7, -2, -7, -4]) == 14
 
-print(first_repeated(part1))
+
+def _first_repeated_from_prefix(prefix: np.ndarray, drift: int) -> Optional[int]:
+    """
+    Find the first repeated frequency from the prefix sums of one pass.
+
+    After k full passes, the frequency at position i is prefix[i] + k * drift,
+    so two positions can only ever meet if their prefix sums are congruent
+    modulo the drift. Within each residue class, every prefix sum is first
+    reached again by its nearest neighbour on the "upstream" side.
+
+    Parameters
+    ----------
+    prefix : np.ndarray
+        Frequencies reached during the first pass, starting with 0
+    drift : int
+        Net change of frequency after one full pass
+
+    Returns
+    -------
+    Optional[int]
+        The first frequency reached twice, or None if it never repeats
+    """
+    n = len(prefix)
+    # a frequency repeated during the first pass beats any later collision
+    order = np.argsort(prefix, kind="stable")
+    sorted_prefix = prefix[order]
+    repeated = sorted_prefix[1:] == sorted_prefix[:-1]
+    if repeated.any():
+        return int(prefix[order[1:][repeated].min()])
+    if drift == 0:
+        # the second pass starts again from 0
+        return int(prefix[0])
+
+    # mirror negative drifts so that frequencies always move upwards
+    sign = 1 if drift > 0 else -1
+    values = sign * prefix
+    step = abs(drift)
+    residues = values % step
+    order = np.lexsort((values, residues))
+    residues, values = residues[order], values[order]
+    same_class = residues[1:] == residues[:-1]
+    if not same_class.any():
+        return None
+    # values[j] reaches values[j + 1] after (gap / step) passes
+    gaps = (values[1:] - values[:-1])[same_class] // step
+    positions = order[:-1][same_class] + gaps * n
+    best = np.argmin(positions)
+    return int(sign * values[1:][same_class][best])
+
+
+def first_repeated_closed_form(list_freqs: List[int]) -> Optional[int]:
+    """
+    Find the first repeated frequency without simulating the cycles.
+
+    Runs in O(n log n) time and O(n) memory, whatever the number of passes
+    the simulation in `first_repeated` would need.
+
+    Parameters
+    ----------
+    list_freqs : List[int]
+        Input list of integers
+
+    Returns
+    -------
+    Optional[int]
+        The first frequency reached twice, or None if it never repeats
+    """
+    drifts = np.asarray(list_freqs, dtype=np.int64)
+    if len(drifts) == 0:
+        return None
+    cumulative = np.cumsum(drifts)
+    prefix = np.concatenate(([0], cumulative[:-1]))
+    return _first_repeated_from_prefix(prefix, int(cumulative[-1]))
+
+
+assert first_repeated_closed_form([+1, -1]) == 0
+assert first_repeated_closed_form([+3, +3, +4, -2, -4]) == 10
+assert first_repeated_closed_form([-6, +3, +8, +5, -6]) == 5
+assert first_repeated_closed_form([+7, +7, -2, -7, -4]) == 14
+assert first_repeated_closed_form([+1, +1]) is None
+assert first_repeated_closed_form([]) is None
+
+
+def first_repeated_streaming(source: Union[str, BinaryIO],
+                             chunk_size: int = CHUNK_SIZE) -> Optional[int]:
+    """
+    Find the first repeated frequency of a drift list read from a stream.
+
+    Only the frequencies of a single pass are kept in memory.
+
+    Parameters
+    ----------
+    source : Union[str, BinaryIO]
+        Path to the drift list, "-" for stdin, or an open file / pipe
+    chunk_size : int, optional
+        Number of bytes read at a time (the default is CHUNK_SIZE)
+
+    Returns
+    -------
+    Optional[int]
+        The first frequency reached twice, or None if it never repeats
+    """
+    frequencies = np.concatenate(
+        [np.zeros(1, dtype=np.int64)]
+        + list(running_frequencies(source, chunk_size))
+    )
+    if len(frequencies) == 1:
+        return None
+    return _first_repeated_from_prefix(frequencies[:-1], int(frequencies[-1]))
+
+
+assert first_repeated_streaming(io.BytesIO(b"+7\n+7\n-2\n-7\n-4\n"), 3) == 14
+
+
+class CalibrationResult(NamedTuple):
+    source: str
+    resulting_frequency: int
+    first_repeated: Optional[int]
+    seconds: float
+
+
+def _calibrate_one(item) -> CalibrationResult:
+    """Solve both parts for one drift list (a path or a list of integers)"""
+    source, drifts = item
+    start = time.perf_counter()
+    if isinstance(drifts, str):
+        drifts = np.concatenate(
+            [np.zeros(0, dtype=np.int64)] + list(read_drifts(drifts))
+        )
+    return CalibrationResult(
+        source=source,
+        resulting_frequency=int(np.sum(drifts, dtype=np.int64)),
+        first_repeated=first_repeated_closed_form(drifts),
+        seconds=time.perf_counter() - start,
+    )
+
+
+def calibrate_batch(drift_lists: Union[str, Iterable[List[int]]],
+                    processes: Optional[int] = None,
+                    chunksize: int = 16) -> List[CalibrationResult]:
+    """
+    Calibrate many devices at once over a pool of processes.
+
+    Parameters
+    ----------
+    drift_lists : Union[str, Iterable[List[int]]]
+        Either a directory holding one drift list file per device (hidden
+        files and subdirectories are skipped), or an iterable of drift lists
+        (or paths to drift list files)
+    processes : Optional[int], optional
+        Number of worker processes (the default is None, one per core)
+    chunksize : int, optional
+        Number of drift lists sent to a worker at a time (the default is 16)
+
+    Returns
+    -------
+    List[CalibrationResult]
+        One result per drift list, in input order, with the time spent on it
+    """
+    if isinstance(drift_lists, str):
+        # one regular, non-hidden file per device
+        items = [
+            (name, os.path.join(drift_lists, name))
+            for name in sorted(os.listdir(drift_lists))
+            if not name.startswith(".")
+            and os.path.isfile(os.path.join(drift_lists, name))
+        ]
+    else:
+        items = [
+            (drifts if isinstance(drifts, str) else str(i), drifts)
+            for i, drifts in enumerate(drift_lists)
+        ]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(_calibrate_one, items, chunksize=chunksize))
+
+
+if __name__ == "__main__":
+    # calibrate_batch's workers may import this module (spawn/forkserver
+    # start methods), so the puzzle itself is only solved when run as a script
+    part1 = np.concatenate(list(read_drifts("data/day01.txt")))
+    print(resulting_frequency_streaming("data/day01.txt"))
+    assert first_repeated_closed_form(part1) == first_repeated(part1)
+    assert first_repeated_streaming("data/day01.txt") == first_repeated(part1)
+    print(first_repeated_closed_form(part1))
+
+    results = calibrate_batch(
+        [[+1, -1], [+3, +3, +4, -2, -4], [-6, +3, +8, +5, -6], [+1, +1]],
+        processes=2,
+        chunksize=1,
+    )
+    assert [r.resulting_frequency for r in results] == [0, 4, 4, 2]
+    assert [r.first_repeated for r in results] == [0, 10, 5, None]
+    assert [r.source for r in results] == ["0", "1", "2", "3"]
+    result, = calibrate_batch(["data/day01.txt"])
+    assert result.first_repeated == first_repeated(part1)
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "device"), "w") as f:
+            f.write("+7\n+7\n-2\n-7\n-4\n")
+        with open(os.path.join(tmp, ".DS_Store"), "w") as f:
+            f.write("not a drift list")
+        os.mkdir(os.path.join(tmp, "sub"))
+        result, = calibrate_batch(tmp, processes=1)
+    assert (result.source, result.first_repeated) == ("device", 14)
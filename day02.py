@@ -39,9 +39,12 @@ The IDs abcde and axcye are close, but they differ by two characters (the second
 
 What letters are common between the two correct box IDs? (In the example above, this is found by removing the differing character from either ID, producing fgij.)
 """
-from collections import Counter
+from collections import Counter, defaultdict
 from itertools import combinations
-from typing import List
+from typing import Iterable, List, Optional, Tuple
+import json
+import os
+import tempfile
 import numpy as np
 
 TEST1 = ["abcdef", "ababab", "abbcde", "abcccd", "aabcdd", "abcdee", "bababc"]
@@ -62,6 +65,42 @@ def checksum(word_list: List[str]) -> int:
     return n_pairs * n_trios
 
 
+def checksum_vectorized(word_list: List[str]) -> int:
+    """
+    Vectorized version of `checksum` for IDs of a fixed width.
+
+    IDs are packed into a uint8 matrix and all letter histograms are built
+    with a single bincount.
+
+    Parameters
+    ----------
+    word_list : List[str]
+        The box IDs, all of the same length
+
+    Returns
+    -------
+    int
+        The checksum
+    """
+    words = np.asarray(word_list, dtype=bytes)
+    if len(words) == 0:
+        return 0
+    width = words.dtype.itemsize
+    letters = words.view(np.uint8).reshape(len(words), width)
+    if (letters == 0).any():
+        raise ValueError("checksum_vectorized needs IDs of a fixed width")
+    lowest = letters.min()
+    n_letters = int(letters.max()) - int(lowest) + 1
+    codes = (letters - lowest).astype(np.int64)
+    codes += n_letters * np.arange(len(words))[:, None]
+    histograms = np.bincount(
+        codes.ravel(), minlength=n_letters * len(words)
+    ).reshape(len(words), n_letters)
+    n_pairs = (histograms == 2).any(axis=1).sum()
+    n_trios = (histograms == 3).any(axis=1).sum()
+    return int(n_pairs * n_trios)
+
+
 def compare_words(word1: str, word2: str):
     if sum([a != b for a, b in zip(word1, word2)]) == 1:
         return "".join([a for a, b in zip(word1, word2) if a == b])
@@ -77,6 +116,125 @@ def find_common_letters(word_list: List[str]) -> str:
     return common
 
 
+def find_all_common_letters(word_list: List[str]) -> List[Tuple[str, str, str]]:
+    """
+    Find every pair of IDs differing by exactly one character, in O(n * L).
+
+    For each position, IDs are bucketed by the string left once the character
+    at that position is masked out: two IDs share a bucket exactly when they
+    have the same length and only differ at that position.
+
+    Parameters
+    ----------
+    word_list : List[str]
+        The box IDs
+
+    Returns
+    -------
+    List[Tuple[str, str, str]]
+        (first ID, second ID, common letters) for every matching pair, in the
+        order the IDs appear in the input
+    """
+    pairs = []
+    max_length = max(map(len, word_list), default=0)
+    # one position at a time, so that only n masked strings are alive at once
+    for pos in range(max_length):
+        buckets = defaultdict(list)
+        for idx, word in enumerate(word_list):
+            if pos < len(word):
+                buckets[word[:pos] + word[pos + 1:]].append(idx)
+        for common, members in buckets.items():
+            for i, j in combinations(members, r=2):
+                # identical IDs share every bucket, they are not near-duplicates
+                if word_list[i] != word_list[j]:
+                    pairs.append((i, j, common))
+        del buckets
+    pairs.sort()
+    return [(word_list[i], word_list[j], common) for i, j, common in pairs]
+
+
+class BoxIndex:
+    """
+    Multi-index hashing of box IDs for k-mismatch queries.
+
+    Each ID is cut into `max_mismatches + 1` segments: by the pigeonhole
+    principle, any ID within `max_mismatches` mismatches of a query shares at
+    least one segment (at the same place) with it, so only the IDs found in
+    the query's segment buckets need to be compared.
+    """
+
+    def __init__(self, word_list: Iterable[str] = (), max_mismatches: int = 1):
+        self.max_mismatches = max_mismatches
+        self.words = []
+        self._buckets = defaultdict(list)
+        for word in word_list:
+            self.insert(word)
+
+    def _segments(self, word: str) -> List[Tuple[int, int, str]]:
+        n_segments = self.max_mismatches + 1
+        bounds = [len(word) * i // n_segments for i in range(n_segments + 1)]
+        return [
+            (len(word), i, word[start:stop])
+            for i, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:]))
+        ]
+
+    def insert(self, word: str) -> int:
+        """Add an ID to the index and return its position in `words`"""
+        idx = len(self.words)
+        self.words.append(word)
+        for key in self._segments(word):
+            self._buckets[key].append(idx)
+        return idx
+
+    def query(self, word: str, k: Optional[int] = None) -> List[str]:
+        """
+        Find all indexed IDs within k mismatches of an ID.
+
+        Parameters
+        ----------
+        word : str
+            The scanned ID
+        k : int, optional
+            Maximum number of mismatches (the default is None, which means
+            `max_mismatches`)
+
+        Returns
+        -------
+        List[str]
+            The matching IDs, in insertion order
+        """
+        if k is None:
+            k = self.max_mismatches
+        if k > self.max_mismatches:
+            raise ValueError(
+                f"index was built for at most {self.max_mismatches} mismatches"
+            )
+        candidates = set()
+        for key in self._segments(word):
+            candidates.update(self._buckets.get(key, ()))
+        return [
+            self.words[idx] for idx in sorted(candidates)
+            if sum(a != b for a, b in zip(word, self.words[idx])) <= k
+        ]
+
+    def save(self, path: str) -> None:
+        """Save the IDs and settings; buckets are rebuilt on load"""
+        with open(path, "w") as f:
+            json.dump(
+                {"max_mismatches": self.max_mismatches, "words": self.words}, f
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "BoxIndex":
+        with open(path) as f:
+            state = json.load(f)
+        if (not isinstance(state, dict)
+                or not isinstance(state.get("max_mismatches"), int)
+                or not isinstance(state.get("words"), list)):
+            raise ValueError(f"{path} does not hold a saved BoxIndex")
+        return cls(state["words"], max_mismatches=state["max_mismatches"])
+
+
 assert count_repetitions("abcdef") == [False, False]
 assert count_repetitions("bababc") == [True, True]
 assert count_repetitions("abbcde") == [True, False]
@@ -86,9 +244,30 @@ assert count_repetitions("abcdee") == [True, False]
 assert count_repetitions("ababab") == [False, True]
 
 assert checksum(TEST1) == 12
+assert checksum_vectorized(TEST1) == 12
+assert checksum_vectorized(TEST2) == checksum(TEST2)
 assert find_common_letters(TEST2) == "fgij"
+assert find_all_common_letters(TEST2) == [("fghij", "fguij", "fgij")]
+assert find_all_common_letters(["abc", "abd", "abc", "abcd", "xbd"]) == [
+    ("abc", "abd", "ab"), ("abd", "abc", "ab"), ("abd", "xbd", "bd")
+]
+
+index = BoxIndex(TEST2, max_mismatches=2)
+assert index.query("fghij", k=1) == ["fghij", "fguij"]
+assert index.query("fghij", k=0) == ["fghij"]
+assert index.query("axcde") == ["abcde", "axcye"]
+index.insert("fghxx")
+assert index.query("fghij") == ["fghij", "fguij", "fghxx"]
+assert index.query("fghi") == []
+with tempfile.TemporaryDirectory() as tmp:
+    index.save(os.path.join(tmp, "index.json"))
+    loaded = BoxIndex.load(os.path.join(tmp, "index.json"))
+assert loaded.max_mismatches == 2 and loaded.words == index.words
+assert loaded.query("fghij") == ["fghij", "fguij", "fghxx"]
 
-part1 = np.loadtxt("data/day02_part1.txt", dtype=str)
+part1 = np.loadtxt("data/day02.txt", dtype=str)
 
-print(checksum(part1))
+assert checksum_vectorized(part1) == checksum(part1)
+print(checksum_vectorized(part1))
 print(find_common_letters(part1))
+assert find_all_common_letters(list(part1))[0][2] == find_common_letters(part1)
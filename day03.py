@@ -49,7 +49,9 @@ For example, in the claims above, only claim 3 is intact after all claims are ma
 What is the ID of the only claim that doesn't overlap?
 
 """
-from typing import NamedTuple, List
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, Iterable, NamedTuple, List, Optional, Set, Tuple
 import numpy as np
 
 TEST = ["#1 @ 1,3: 4x4", "#2 @ 3,1: 4x4", "#3 @ 5,5: 2x2"]
@@ -80,6 +82,384 @@ def count_overclaimed(claims_str: List[str]) -> int:
     return ((canvas > 1).sum())
 
 
+def claims_to_arrays(claims: List[claim]) -> np.ndarray:
+    """Stack the left, top, right and bottom edges of claims in an (n, 4) array"""
+    return np.array(
+        [[c.left, c.top, c.right, c.bottom] for c in claims], dtype=np.int64
+    ).reshape(-1, 4)
+
+
+def _rects_coverage(rects: np.ndarray, shape: Tuple[int, int]) -> np.ndarray:
+    """int32 coverage of an (n, 4) array of left, top, right, bottom edges"""
+    width, height = shape
+    left, top, right, bottom = rects.T
+    diff = np.zeros((width + 1, height + 1), dtype=np.int32)
+    np.add.at(diff, (np.concatenate([left, right, left, right]),
+                     np.concatenate([top, top, bottom, bottom])),
+              np.repeat(np.array([1, -1, -1, 1], dtype=np.int32), len(left)))
+    np.cumsum(diff, axis=0, out=diff)
+    np.cumsum(diff, axis=1, out=diff)
+    return diff[:width, :height]
+
+
+def coverage_diff(claims: List[claim],
+                  canvas_size: Optional[Tuple[int, int]] = None) -> np.ndarray:
+    """
+    Count the claims covering each square inch with a difference array.
+
+    Each claim adds four corner deltas, scattered all at once, and two
+    cumulative sums rebuild the coverage.
+
+    Parameters
+    ----------
+    claims : List[claim]
+        The claims
+    canvas_size : Tuple[int, int], optional
+        (width, height) of the canvas (the default is None, which means
+        `get_canvas_size(claims)`)
+
+    Returns
+    -------
+    np.ndarray
+        int32 canvas of shape (width, height)
+    """
+    if canvas_size is None:
+        canvas_size = get_canvas_size(claims)
+    return _rects_coverage(claims_to_arrays(claims), canvas_size)
+
+
+def count_overclaimed_diff(claims_str: List[str]) -> int:
+    """Same as `count_overclaimed`, in O(claims + canvas) time"""
+    return int((coverage_diff(process_claims(claims_str)) > 1).sum())
+
+
+def find_intact_claims(claims: List[claim],
+                       coverage: Optional[np.ndarray] = None) -> List[int]:
+    """
+    Find the IDs of all claims that do not overlap any other claim.
+
+    A summed-area table over the overlap mask is built once, after which
+    each claim is checked in O(1).
+
+    Parameters
+    ----------
+    claims : List[claim]
+        The claims
+    coverage : np.ndarray, optional
+        Number of claims covering each square inch (the default is None,
+        which means it is computed with `coverage_diff`)
+
+    Returns
+    -------
+    List[int]
+        The IDs of the intact claims
+    """
+    if coverage is None:
+        coverage = coverage_diff(claims)
+    table = np.zeros(
+        (coverage.shape[0] + 1, coverage.shape[1] + 1), dtype=np.int64
+    )
+    table[1:, 1:] = (coverage > 1).cumsum(axis=0).cumsum(axis=1)
+    left, top, right, bottom = claims_to_arrays(claims).T
+    overlapped = (table[right, bottom] - table[left, bottom]
+                  - table[right, top] + table[left, top])
+    return [c.cid for c, n in zip(claims, overlapped) if n == 0]
+
+
+class _SweepTree:
+    """
+    Segment tree over compressed y coordinates used by `sweep_claims`.
+
+    Each node counts the active claims whose y-range covers it canonically,
+    and keeps track of the length covered at least once and at least twice.
+    Claims not yet known to collide with another one are also kept per node,
+    so that they can be flagged when a later claim lands on them.
+    """
+
+    def __init__(self, ys: List[int]) -> None:
+        self.ys = ys
+        size = 4 * max(len(ys) - 1, 1)
+        self.count = [0] * size
+        self.below = [0] * size
+        self.once = [0] * size
+        self.twice = [0] * size
+        self.unmarked = {}
+        self.unmarked_below = [0] * size
+        self.marked = set()
+
+    def _pull(self, node: int, lo: int, hi: int) -> None:
+        full = self.ys[hi] - self.ys[lo]
+        count = self.count[node]
+        if hi - lo == 1:
+            once = twice = below = unmarked = 0
+        else:
+            left, right = 2 * node, 2 * node + 1
+            once = self.once[left] + self.once[right]
+            twice = self.twice[left] + self.twice[right]
+            below = self.below[left] + self.below[right]
+            unmarked = self.unmarked_below[left] + self.unmarked_below[right]
+        if count >= 2:
+            once = twice = full
+        elif count == 1:
+            once, twice = full, once
+        self.once[node] = once
+        self.twice[node] = twice
+        self.below[node] = count + below
+        self.unmarked_below[node] = len(self.unmarked.get(node, ())) + unmarked
+
+    def _mark(self, node: int) -> None:
+        cids = self.unmarked.pop(node, None)
+        if cids:
+            self.marked.update(cids)
+
+    def _mark_subtree(self, node: int, lo: int, hi: int) -> None:
+        if self.unmarked_below[node] == 0:
+            return
+        self._mark(node)
+        if hi - lo > 1:
+            mid = (lo + hi) // 2
+            self._mark_subtree(2 * node, lo, mid)
+            self._mark_subtree(2 * node + 1, mid, hi)
+        self.unmarked_below[node] = 0
+
+    def collide(self, node: int, lo: int, hi: int, l: int, r: int) -> bool:
+        """Flag every active claim overlapping [l, r), return True if any"""
+        if r <= lo or hi <= l:
+            return False
+        # claims stored here span the whole node, which meets [l, r)
+        hit = self.count[node] > 0
+        self._mark(node)
+        if l <= lo and hi <= r:
+            hit = hit or self.below[node] > 0
+            self._mark_subtree(node, lo, hi)
+            return hit
+        mid = (lo + hi) // 2
+        hit_left = self.collide(2 * node, lo, mid, l, r)
+        hit_right = self.collide(2 * node + 1, mid, hi, l, r)
+        self._pull(node, lo, hi)
+        return hit or hit_left or hit_right
+
+    def update(self, node: int, lo: int, hi: int, l: int, r: int,
+               cid: int, delta: int, unmarked: bool) -> None:
+        """Add (delta=1) or remove (delta=-1) a claim spanning [l, r)"""
+        if r <= lo or hi <= l:
+            return
+        if l <= lo and hi <= r:
+            self.count[node] += delta
+            if delta > 0 and unmarked:
+                self.unmarked.setdefault(node, set()).add(cid)
+            elif delta < 0 and node in self.unmarked:
+                self.unmarked[node].discard(cid)
+        else:
+            mid = (lo + hi) // 2
+            self.update(2 * node, lo, mid, l, r, cid, delta, unmarked)
+            self.update(2 * node + 1, mid, hi, l, r, cid, delta, unmarked)
+        self._pull(node, lo, hi)
+
+
+def sweep_claims(claims: List[claim]) -> Tuple[int, List[int]]:
+    """
+    Overclaimed area and intact claims, without allocating a canvas.
+
+    A vertical line sweeps over the left and right edges of the claims, while
+    a segment tree over the compressed y coordinates tracks the active ones.
+    Memory scales with the number of claims, not with the fabric size.
+
+    Parameters
+    ----------
+    claims : List[claim]
+        The claims
+
+    Returns
+    -------
+    Tuple[int, List[int]]
+        The area claimed at least twice and the IDs of the intact claims
+    """
+    claims = [c for c in claims if c.width > 0 and c.height > 0]
+    if not claims:
+        return 0, []
+    ys = sorted(set([c.top for c in claims] + [c.bottom for c in claims]))
+    y_rank = {y: i for i, y in enumerate(ys)}
+    # at equal x, claims ending there leave before new ones enter
+    events = sorted(
+        [(c.right, 0, i) for i, c in enumerate(claims)]
+        + [(c.left, 1, i) for i, c in enumerate(claims)]
+    )
+    tree = _SweepTree(ys)
+    n = len(ys) - 1
+    area = 0
+    prev_x = events[0][0]
+    for x, entering, i in events:
+        area += tree.twice[1] * (x - prev_x)
+        prev_x = x
+        l, r = y_rank[claims[i].top], y_rank[claims[i].bottom]
+        if entering:
+            hit = tree.collide(1, 0, n, l, r)
+            if hit:
+                tree.marked.add(i)
+            tree.update(1, 0, n, l, r, i, 1, not hit)
+        else:
+            tree.update(1, 0, n, l, r, i, -1, False)
+    intact = [c.cid for i, c in enumerate(claims) if i not in tree.marked]
+    return area, intact
+
+
+def _tile_coverage(task) -> int:
+    """Fill one tile of the shared canvas, return its overclaimed area"""
+    name, shape, x0, x1, y0, y1, rects = task
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        canvas = np.ndarray(shape, dtype=np.int32, buffer=shm.buf)
+        # clip the claims to the tile, in tile coordinates
+        local = np.clip(rects - [x0, y0, x0, y0], 0,
+                        [x1 - x0, y1 - y0, x1 - x0, y1 - y0])
+        tile = _rects_coverage(local, (x1 - x0, y1 - y0))
+        canvas[x0:x1, y0:y1] = tile
+        overclaimed = int((tile > 1).sum())
+        del canvas
+    finally:
+        shm.close()
+    return overclaimed
+
+
+def coverage_tiled(claims: List[claim], tile_size: int = 512,
+                   processes: Optional[int] = None) -> Tuple[np.ndarray, int]:
+    """
+    Build the coverage canvas tile by tile over a pool of processes.
+
+    The canvas lives in shared memory. Claims are bucketed by the tiles they
+    intersect beforehand, and each worker only fills its own tile, so that
+    no two workers write to the same square inch.
+
+    Parameters
+    ----------
+    claims : List[claim]
+        The claims
+    tile_size : int, optional
+        Side of the square tiles (the default is 512)
+    processes : Optional[int], optional
+        Number of worker processes (the default is None, one per core)
+
+    Returns
+    -------
+    Tuple[np.ndarray, int]
+        The int32 coverage canvas and the overclaimed area
+    """
+    shape = get_canvas_size(claims)
+    rects = claims_to_arrays(claims)
+    rects = rects[(rects[:, 2] > rects[:, 0]) & (rects[:, 3] > rects[:, 1])]
+    left, top, right, bottom = rects.T
+
+    # expand every claim into the list of tiles it intersects
+    tx0, ty0 = left // tile_size, top // tile_size
+    nx = (right - 1) // tile_size - tx0 + 1
+    ny = (bottom - 1) // tile_size - ty0 + 1
+    counts = nx * ny
+    owner = np.repeat(np.arange(len(rects)), counts)
+    rank = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    tx = tx0[owner] + rank // ny[owner]
+    ty = ty0[owner] + rank % ny[owner]
+    n_tiles_y = -(-shape[1] // tile_size)
+    tile_ids = tx * n_tiles_y + ty
+    order = np.argsort(tile_ids, kind="stable")
+    tile_ids, owner = tile_ids[order], owner[order]
+    tiles, starts = np.unique(tile_ids, return_index=True)
+    stops = np.append(starts[1:], len(tile_ids))
+
+    shm = shared_memory.SharedMemory(
+        create=True, size=max(shape[0] * shape[1], 1) * 4
+    )
+    try:
+        canvas = np.ndarray(shape, dtype=np.int32, buffer=shm.buf)
+        canvas[:] = 0
+        tasks = []
+        for tile, start, stop in zip(tiles, starts, stops):
+            x0 = int(tile // n_tiles_y) * tile_size
+            y0 = int(tile % n_tiles_y) * tile_size
+            x1 = min(x0 + tile_size, shape[0])
+            y1 = min(y0 + tile_size, shape[1])
+            tasks.append((shm.name, shape, x0, x1, y0, y1,
+                          rects[owner[start:stop]]))
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            overclaimed = sum(pool.map(_tile_coverage, tasks))
+        coverage = canvas.copy()
+        del canvas
+    finally:
+        shm.close()
+        shm.unlink()
+    return coverage, overclaimed
+
+
+def count_overclaimed_tiled(claims_str: List[str], tile_size: int = 512,
+                            processes: Optional[int] = None) -> int:
+    """Same as `count_overclaimed`, spread over several cores"""
+    _, overclaimed = coverage_tiled(
+        process_claims(claims_str), tile_size, processes
+    )
+    return overclaimed
+
+
+def claims_overlap(a: claim, b: claim) -> bool:
+    return (a.left < b.right and b.left < a.right
+            and a.top < b.bottom and b.top < a.bottom)
+
+
+class ClaimOverlapGraph:
+    """
+    Which claims overlap which, maintained with a uniform grid of buckets.
+
+    Each claim is registered in the grid cells it touches, so inserting a
+    claim only compares it with the claims sharing one of its cells.
+    """
+
+    def __init__(self, claims: Iterable[claim] = (),
+                 cell_size: Optional[int] = None) -> None:
+        claims = list(claims)
+        if cell_size is None:
+            # cells about as large as a typical claim
+            sides = [max(c.width, c.height) for c in claims]
+            cell_size = max(1, sum(sides) // len(sides)) if sides else 64
+        self.cell_size = cell_size
+        self.claims: Dict[int, claim] = {}
+        self.adjacency: Dict[int, Set[int]] = {}
+        self._cells: Dict[Tuple[int, int], Set[int]] = {}
+        for c in claims:
+            self.insert(c)
+
+    def _cells_of(self, c: claim) -> Iterable[Tuple[int, int]]:
+        size = self.cell_size
+        for cx in range(c.left // size, (c.right - 1) // size + 1):
+            for cy in range(c.top // size, (c.bottom - 1) // size + 1):
+                yield cx, cy
+
+    def insert(self, c: claim) -> None:
+        if c.cid in self.claims:
+            raise ValueError(f"claim #{c.cid} is already in the graph")
+        self.claims[c.cid] = c
+        neighbours = self.adjacency[c.cid] = set()
+        for cell in self._cells_of(c):
+            bucket = self._cells.setdefault(cell, set())
+            for other in bucket:
+                if other not in neighbours and claims_overlap(c, self.claims[other]):
+                    neighbours.add(other)
+                    self.adjacency[other].add(c.cid)
+            bucket.add(c.cid)
+
+    def remove(self, cid: int) -> None:
+        c = self.claims.pop(cid)
+        for other in self.adjacency.pop(cid):
+            self.adjacency[other].discard(cid)
+        for cell in self._cells_of(c):
+            bucket = self._cells[cell]
+            bucket.discard(cid)
+            if not bucket:
+                del self._cells[cell]
+
+    def overlapping(self, cid: int) -> Set[int]:
+        """IDs of the claims overlapping a claim"""
+        return self.adjacency[cid]
+
+
 def process_claims(inputs: List[str]) -> List[claim]:
     """parse a list of claims
 
@@ -115,19 +495,42 @@ def process_claims(inputs: List[str]) -> List[claim]:
 TEST = ["#1 @ 1,3: 4x4", "#2 @ 3,1: 4x4", "#3 @ 5,5: 2x2"]
 
 assert count_overclaimed(TEST) == 4
+assert count_overclaimed_diff(TEST) == 4
+assert sweep_claims(process_claims(TEST)) == (4, [3])
+
+graph = ClaimOverlapGraph(process_claims(TEST))
+assert graph.adjacency == {1: {2}, 2: {1}, 3: set()}
+graph.remove(2)
+graph.insert(claim(cid=4, left=5, top=5, width=1, height=1, right=6, bottom=6))
+assert graph.adjacency == {1: set(), 3: {4}, 4: {3}}
+
+assert find_intact_claims(process_claims(TEST)) == [3]
+
+if __name__ == "__main__":
+    # the puzzle is only solved when run as a script: coverage_tiled's workers
+    # import this module again under the spawn and forkserver start methods
+    with open("data/day03.txt") as f:
+        part1 = [x.strip() for x in f]
+
+    # part 1
+    assert count_overclaimed_diff(part1) == count_overclaimed(part1)
+    print(count_overclaimed_diff(part1))
+
+    assert sweep_claims(process_claims(part1)) == (
+        count_overclaimed(part1), find_intact_claims(process_claims(part1))
+    )
+    graph = ClaimOverlapGraph(process_claims(part1))
+    assert [cid for cid, others in graph.adjacency.items() if not others] == (
+        find_intact_claims(process_claims(part1))
+    )
+
+    # part 2
+    for cid in find_intact_claims(process_claims(part1)):
+        print(cid)
 
-with open("data/day03.txt") as f:
-    part1 = [x.strip() for x in f]
-
-# part 1
-print(count_overclaimed(part1))
-
-# part 2
-claims = process_claims(part1)
-max_width, max_height = get_canvas_size(claims)
-canvas = np.zeros((max_width, max_height))
-for claim in claims:
-    canvas[claim.left: claim.right, claim.top: claim.bottom] += 1
-for claim in claims:
-    if set(canvas[claim.left: claim.right, claim.top: claim.bottom].reshape(-1)) == set([1]):
-        print(claim.cid)
+    assert count_overclaimed_tiled(TEST, tile_size=3, processes=2) == 4
+    coverage, overclaimed = coverage_tiled(
+        process_claims(part1), tile_size=128, processes=4
+    )
+    assert overclaimed == count_overclaimed_diff(part1)
+    assert (coverage == coverage_diff(process_claims(part1))).all()
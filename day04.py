@@ -1,6 +1,20 @@
+import asyncio
+import datetime
+import heapq
+import itertools
+import os
+import random
+import tempfile
+import time
 import numpy as np
+from typing import Dict
+from typing import IO
+from typing import Iterable
 from typing import Iterator
 from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
 """
 --- Day 4: Repose Record ---
 You've sneaked into another supply closet - this time, it's across from the prototype suit manufacturing lab. You need to sneak inside and fix the issues with the suit, but there's a guard stationed outside the lab, so this is as close as you can safely get.
@@ -110,6 +124,270 @@ class ShiftCollection:
         return pattern
 
 
+class ColumnarShiftCollection:
+    """
+    Shifts stored column-wise: guard index, date and an (n_shifts x 60) uint8
+    matrix of sleep patterns.
+
+    Per-guard minute histograms are built in a single `np.add.at` pass, so
+    both strategies boil down to a few reductions.
+    """
+
+    def __init__(self, guard_index: np.ndarray, dates: np.ndarray,
+                 patterns: np.ndarray, guards: List[str]) -> None:
+        self.guard_index = guard_index
+        self.dates = dates
+        self.patterns = patterns
+        self.guards = guards
+        histograms = np.zeros((len(guards), 60), dtype=np.int64)
+        np.add.at(histograms, guard_index, patterns)
+        self.minute_histograms = histograms
+        self.total_minutes = histograms.sum(axis=1)
+
+    @classmethod
+    def from_shifts(cls, shifts: Iterable[Shift]) -> "ColumnarShiftCollection":
+        shifts = list(shifts)
+        guards, guard_index = np.unique(
+            [shift.guard for shift in shifts], return_inverse=True
+        )
+        dates = np.array(
+            [int(shift.year + shift.month + shift.day) for shift in shifts],
+            dtype=np.int64,
+        )
+        patterns = np.array(
+            [shift.pattern for shift in shifts], dtype=np.uint8
+        ).reshape(-1, 60)
+        return cls(guard_index.reshape(-1), dates, patterns, list(guards))
+
+    def strategy1(self) -> Tuple[str, int]:
+        """The guard asleep the longest, and the minute they sleep the most"""
+        guard = int(np.argmax(self.total_minutes))
+        return self.guards[guard], int(np.argmax(self.minute_histograms[guard]))
+
+    def strategy2(self) -> Tuple[str, int]:
+        """The guard most frequently asleep on the same minute, and that minute"""
+        guard, minute = np.unravel_index(
+            np.argmax(self.minute_histograms), self.minute_histograms.shape
+        )
+        return self.guards[guard], int(minute)
+
+
+class SleepIndex:
+    """
+    Per-guard prefix sums of sleep over (day x minute), for range queries.
+
+    `prefix[g, d, m]` is the number of minutes guard g slept during the first
+    d days of the index, restricted to the first m minutes of the hour, so
+    any date range and minute range is aggregated in O(1) per guard.
+    """
+
+    def __init__(self, guards: List[str], first_day: int,
+                 prefix: np.ndarray) -> None:
+        self.guards = guards
+        self.first_day = first_day
+        self.prefix = prefix
+
+    @classmethod
+    def from_shifts(cls, shifts: ColumnarShiftCollection) -> "SleepIndex":
+        days = np.array([
+            datetime.date(date // 10000, date // 100 % 100, date % 100).toordinal()
+            for date in shifts.dates
+        ], dtype=np.int64)
+        first_day = int(days.min()) if len(days) else 0
+        n_days = int(days.max()) - first_day + 1 if len(days) else 0
+        prefix = np.zeros((len(shifts.guards), n_days + 1, 61), dtype=np.int64)
+        np.add.at(prefix, (shifts.guard_index, days - first_day + 1),
+                  np.pad(shifts.patterns, ((0, 0), (1, 0))))
+        np.cumsum(prefix, axis=1, out=prefix)
+        np.cumsum(prefix, axis=2, out=prefix)
+        return cls(guards=list(shifts.guards), first_day=first_day, prefix=prefix)
+
+    def _day(self, date: Union[datetime.date, str]) -> int:
+        if isinstance(date, str):
+            date = datetime.date.fromisoformat(date)
+        day = date.toordinal() - self.first_day
+        return min(max(day, 0), self.prefix.shape[1] - 1)
+
+    def minutes_asleep(self, start: Union[datetime.date, str],
+                       end: Union[datetime.date, str],
+                       first_minute: int = 0,
+                       last_minute: int = 60) -> np.ndarray:
+        """
+        Minutes each guard slept between two dates, within a minute range.
+
+        Parameters
+        ----------
+        start : Union[datetime.date, str]
+            First day of the range (a date or "YYYY-MM-DD")
+        end : Union[datetime.date, str]
+            Day after the last day of the range
+        first_minute : int, optional
+            First minute of the range (the default is 0)
+        last_minute : int, optional
+            Minute after the last minute of the range (the default is 60)
+
+        Returns
+        -------
+        np.ndarray
+            Minutes asleep, one entry per guard in `guards`
+        """
+        d0, d1 = self._day(start), self._day(end)
+        p = self.prefix
+        return (p[:, d1, last_minute] - p[:, d0, last_minute]
+                - p[:, d1, first_minute] + p[:, d0, first_minute])
+
+    def most_asleep(self, start: Union[datetime.date, str],
+                    end: Union[datetime.date, str],
+                    first_minute: int = 0,
+                    last_minute: int = 60) -> Tuple[str, int]:
+        """The guard who slept the most over a range, and how long"""
+        minutes = self.minutes_asleep(start, end, first_minute, last_minute)
+        guard = int(np.argmax(minutes))
+        return self.guards[guard], int(minutes[guard])
+
+    def totals_per_period(self, days: int = 7) -> np.ndarray:
+        """Minutes asleep per guard over consecutive periods, e.g. weeks"""
+        bounds = np.arange(0, self.prefix.shape[1] - 1 + days, days)
+        bounds = np.minimum(bounds, self.prefix.shape[1] - 1)
+        return np.diff(self.prefix[:, bounds, 60], axis=1)
+
+    def save(self, path: str) -> None:
+        # through a file object, np.savez would otherwise append ".npz"
+        with open(path, "wb") as f:
+            np.savez(f, guards=np.array(self.guards), prefix=self.prefix,
+                     first_day=self.first_day)
+
+    @classmethod
+    def load(cls, path: str) -> "SleepIndex":
+        with np.load(path) as data:
+            return cls(guards=[str(guard) for guard in data["guards"]],
+                       first_day=int(data["first_day"]),
+                       prefix=data["prefix"])
+
+
+class LiveGuardLog:
+    """
+    Guard statistics updated line by line as the notes are written.
+
+    Lines may arrive out of order, as long as they are at most
+    `reorder_window` lines late: they are held in a heap and only applied
+    once `reorder_window` newer lines have been received. A nap is counted
+    when the guard wakes up (or when the next shift begins).
+    """
+
+    def __init__(self, reorder_window: int = 64) -> None:
+        self.reorder_window = reorder_window
+        self.minute_histograms: Dict[str, np.ndarray] = {}
+        self.total_minutes: Dict[str, int] = {}
+        self._pending = []
+        self._last = ""
+        self._guard = None
+        self._asleep_since = None
+
+    def add(self, line: str) -> None:
+        """Receive one line of notes"""
+        line = line.strip()
+        if not line:
+            return
+        if line[:18] < self._last:
+            raise ValueError(
+                f"{line!r} arrived more than {self.reorder_window} lines late"
+            )
+        heapq.heappush(self._pending, line)
+        if len(self._pending) > self.reorder_window:
+            self._apply(heapq.heappop(self._pending))
+
+    def add_lines(self, lines: Iterable[str]) -> None:
+        for line in lines:
+            self.add(line)
+
+    async def consume(self, reader: asyncio.StreamReader) -> None:
+        """Receive lines from an asyncio stream until it is closed"""
+        async for line in reader:
+            self.add(line.decode())
+
+    def flush(self) -> None:
+        """Apply all the pending lines, e.g. once the log is complete"""
+        while self._pending:
+            self._apply(heapq.heappop(self._pending))
+
+    def _nap(self, stop: int) -> None:
+        self.minute_histograms[self._guard][self._asleep_since:stop] += 1
+        self.total_minutes[self._guard] += stop - self._asleep_since
+        self._asleep_since = None
+
+    def _apply(self, line: str) -> None:
+        self._last = line[:18]
+        minute = int(line[15:17])
+        text = line[19:]
+        if text.startswith("Guard"):
+            if self._asleep_since is not None:
+                self._nap(60)
+            self._guard = text.split(" ")[1]
+            if self._guard not in self.minute_histograms:
+                self.minute_histograms[self._guard] = np.zeros(60, dtype=np.int64)
+                self.total_minutes[self._guard] = 0
+        elif self._guard is None:
+            return
+        elif text == "falls asleep":
+            if self._asleep_since is None:
+                self._asleep_since = minute
+        elif text == "wakes up":
+            if self._asleep_since is not None:
+                self._nap(minute)
+
+    def strategy1(self) -> Optional[Tuple[str, int]]:
+        """
+        The guard asleep the longest, and the minute they sleep the most.
+
+        None until a first guard line has left the reorder window.
+        """
+        if not self.total_minutes:
+            return None
+        guard = max(self.total_minutes, key=self.total_minutes.get)
+        return guard, int(np.argmax(self.minute_histograms[guard]))
+
+    def strategy2(self) -> Optional[Tuple[str, int]]:
+        """
+        The guard most frequently asleep on the same minute, and that minute.
+
+        None until a first guard line has left the reorder window.
+        """
+        if not self.minute_histograms:
+            return None
+        guard = max(self.minute_histograms,
+                    key=lambda guard: self.minute_histograms[guard].max())
+        return guard, int(np.argmax(self.minute_histograms[guard]))
+
+
+def follow(f: IO[str], poll_interval: float = 1.0) -> Iterator[str]:
+    """
+    Tail a file, yielding lines as they are appended to it. Never returns.
+
+    Parameters
+    ----------
+    f : IO[str]
+        The open file
+    poll_interval : float, optional
+        Seconds to wait before checking for new lines (the default is 1.0)
+
+    Returns
+    -------
+    Iterator[str]
+        The complete lines of the file
+    """
+    partial = ""
+    while True:
+        line = f.readline()
+        if not line:
+            time.sleep(poll_interval)
+            continue
+        partial += line
+        if partial.endswith("\n"):
+            yield partial
+            partial = ""
+
+
 def split_notes_by_shift(input: List[str]) -> Iterator[List[str]]:
     have_guard = [i for i, x in enumerate(
         sorted(input)) if x.find("Guard") > -1] + [len(input)]
@@ -155,6 +433,65 @@ def process_shift_notes(shift_notes: List[str]) -> Shift:
     return shift
 
 
+def parse_shifts(input: Iterable[str], presorted: bool = False) -> Iterator[Shift]:
+    """
+    Parse the notes into shifts in a single pass.
+
+    Every line is split once, its minute parsed to an integer once, and the
+    notes are sorted at most once.
+
+    Parameters
+    ----------
+    input : Iterable[str]
+        The puzzle's input, lines of the form "[1518-11-01 00:05] falls asleep"
+    presorted : bool, optional
+        True if the lines already come in chronological order, in which case
+        they are consumed lazily (the default is False)
+
+    Returns
+    -------
+    Iterator[Shift]
+        The shifts, in chronological order
+    """
+    lines = input if presorted else sorted(input)
+    shift = None
+    dated = False
+    asleep_since = None
+    for line in lines:
+        line = line.rstrip()
+        if not line:
+            continue
+        # "[1518-11-01 00:05] falls asleep"
+        year, month, day = line[1:5], line[6:8], line[9:11]
+        minute = int(line[15:17])
+        text = line[19:]
+        if text.startswith("Guard"):
+            if shift is not None:
+                if asleep_since is not None:
+                    shift.pattern[asleep_since:] = 1
+                yield shift
+            guard = text.split(" ")[1]
+            shift = Shift(year=year, month=month, day=day, guard=guard)
+            dated = False
+            asleep_since = None
+        elif shift is not None:
+            if not dated:
+                # the shift's date is the one of its first event
+                shift.year, shift.month, shift.day = year, month, day
+                dated = True
+            if text == "falls asleep":
+                if asleep_since is None:
+                    asleep_since = minute
+            elif text == "wakes up":
+                if asleep_since is not None:
+                    shift.pattern[asleep_since:minute] = 1
+                asleep_since = None
+    if shift is not None:
+        if asleep_since is not None:
+            shift.pattern[asleep_since:] = 1
+        yield shift
+
+
 def solve_part1(input: List[str], test=False):
     """
     Solve part 1 of day's 4 challenge
@@ -167,25 +504,16 @@ def solve_part1(input: List[str], test=False):
         True if input is just the test input (the default is False)
     """
 
-    shifts = []
-    for shift_notes in split_notes_by_shift(input):
-        shift = process_shift_notes(shift_notes)
-        shifts.append(shift)
-    shiftcollection = ShiftCollection(shifts=shifts)
+    shifts = ColumnarShiftCollection.from_shifts(parse_shifts(input))
     if test:
-        assert shiftcollection.total_minutes == {'#10': 50.0, '#99': 30.0}
-    total_mins, guards = np.array([[minutes, guard]
-                                   for guard, minutes
-                                   in shiftcollection.total_minutes.items()]).T
-    maxmins = max(total_mins)
+        assert dict(zip(shifts.guards, shifts.total_minutes)) == {
+            '#10': 50, '#99': 30
+        }
     # make sure the max is unique
-    assert np.sum(total_mins == maxmins) == 1
-    most_lazy = guards[np.argmax(total_mins)]
+    assert np.sum(shifts.total_minutes == shifts.total_minutes.max()) == 1
+    most_lazy, most_slept_minute = shifts.strategy1()
     if test:
         assert most_lazy == "#10"
-    most_lazy_patterns = np.array(
-        shiftcollection.get_guard_patterns(most_lazy))
-    most_slept_minute = np.argmax(np.sum(most_lazy_patterns, axis=0))
     print(most_lazy, most_slept_minute)
 
 
@@ -201,31 +529,107 @@ def solve_part2(input: List[str], test=False):
         True if input is just the test input (the default is False)
     """
 
-    shifts = []
-    for shift_notes in split_notes_by_shift(input):
-        shift = process_shift_notes(shift_notes)
-        shifts.append(shift)
-    shiftcollection = ShiftCollection(shifts=shifts)
-    guards = []
-    max_total_minutes = []
-    most_sleeped_minutes = []
-    for guard in shiftcollection.guards:
-        arr = np.array(shiftcollection.get_guard_patterns(guard))
-        total_minutes = np.sum(arr, axis=0)
-        guards.append(guard)
-        max_total_minutes.append(max(total_minutes))
-        most_sleeped_minutes.append(np.argmax(total_minutes))
-
-    chosen_guard = np.argmax(max_total_minutes)
+    shifts = ColumnarShiftCollection.from_shifts(parse_shifts(input))
+    guard, most_sleeped_minute = shifts.strategy2()
     if test:
-        assert guards[chosen_guard] == "#99"
-        assert most_sleeped_minutes[chosen_guard] == 45
-    print(guards[chosen_guard], most_sleeped_minutes[chosen_guard])
+        assert guard == "#99"
+        assert most_sleeped_minute == 45
+    print(guard, most_sleeped_minute)
+
+
+def _same_shifts(shifts1: List[Shift], shifts2: List[Shift]) -> bool:
+    return len(shifts1) == len(shifts2) and all(
+        (a.year, a.month, a.day, a.guard) == (b.year, b.month, b.day, b.guard)
+        and (a.pattern == b.pattern).all()
+        for a, b in zip(shifts1, shifts2)
+    )
 
 
 with open("data/day04.txt") as f:
     lines = [line.strip() for line in f]
-solve_part1(TEST, test=True)
-solve_part1(lines, test=False)
-solve_part2(TEST, test=True)
-solve_part2(lines, test=False)
+for notes in [TEST, lines]:
+    reference = [process_shift_notes(n) for n in split_notes_by_shift(notes)]
+    assert _same_shifts(list(parse_shifts(notes)), reference)
+    assert _same_shifts(list(parse_shifts(iter(sorted(notes)), presorted=True)),
+                        reference)
+    # as read from a file, with line endings and a trailing blank line
+    from_file = iter([line + "\n" for line in sorted(notes)] + ["\n"])
+    assert _same_shifts(list(parse_shifts(from_file, presorted=True)), reference)
+    columnar = ColumnarShiftCollection.from_shifts(reference)
+    index = SleepIndex.from_shifts(columnar)
+    in_spring = (columnar.dates >= 15180301) & (columnar.dates < 15180601)
+    for guard, minutes in zip(index.guards,
+                              index.minutes_asleep("1518-03-01", "1518-06-01",
+                                                   17, 18)):
+        guard_shifts = in_spring & (columnar.guard_index
+                                    == columnar.guards.index(guard))
+        assert minutes == columnar.patterns[guard_shifts, 17].sum()
+    assert (index.totals_per_period(7).sum(axis=1)
+            == columnar.total_minutes).all()
+    live = LiveGuardLog(reorder_window=len(notes))
+    live.add_lines(notes)
+    live.flush()
+    assert live.strategy1() == columnar.strategy1()
+    assert live.strategy2() == columnar.strategy2()
+    collection = ShiftCollection(shifts=reference)
+    assert {
+        guard: float(minutes)
+        for guard, minutes in zip(columnar.guards, columnar.total_minutes)
+    } == collection.total_minutes
+live = LiveGuardLog()
+live.add_lines(TEST[:2])
+assert live.strategy1() is None and live.strategy2() is None
+
+if __name__ == "__main__":
+    # checks touching the file system, or too slow to run on every import
+    with tempfile.TemporaryDirectory() as tmp:
+        index.save(os.path.join(tmp, "index"))
+        loaded = SleepIndex.load(os.path.join(tmp, "index"))
+    assert loaded.guards == index.guards
+    assert loaded.first_day == index.first_day
+    assert (loaded.prefix == index.prefix).all()
+
+    # lines at most 7 places out of order, for a live log with a window of 8
+    ordered = sorted(lines)
+    shuffled = []
+    rng = random.Random(0)
+    for start in range(0, len(ordered), 8):
+        block = ordered[start: start + 8]
+        rng.shuffle(block)
+        shuffled += block
+    in_order = LiveGuardLog(reorder_window=0)
+    in_order.add_lines(ordered[:-8])
+    live = LiveGuardLog(reorder_window=8)
+    live.add_lines(shuffled)
+    # the last 8 lines are still waiting in the window
+    assert live.strategy1() == in_order.strategy1()
+    assert live.strategy2() == in_order.strategy2()
+    assert live.minute_histograms.keys() == in_order.minute_histograms.keys()
+    assert all((live.minute_histograms[guard] == hist).all()
+               for guard, hist in in_order.minute_histograms.items())
+    live.flush()
+    columnar = ColumnarShiftCollection.from_shifts(parse_shifts(lines))
+    assert live.strategy1() == columnar.strategy1()
+    assert live.strategy2() == columnar.strategy2()
+    live = LiveGuardLog(reorder_window=2)
+    live.add_lines(ordered[5:8])
+    try:
+        live.add(ordered[0])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("a line later than the window must be rejected")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "log"), "w") as f:
+            f.write("\n".join(sorted(TEST[:4])) + "\n")
+        with open(os.path.join(tmp, "log")) as f:
+            assert list(itertools.islice(follow(f, 0.01), 4)) == [
+                line + "\n" for line in sorted(TEST[:4])
+            ]
+
+    solve_part1(TEST, test=True)
+    solve_part1(lines, test=False)
+    solve_part2(TEST, test=True)
+    solve_part2(lines, test=False)
+
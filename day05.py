@@ -1,4 +1,10 @@
+import io
+import mmap
+import os
 import string
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Dict, List, Optional, Tuple
 """
 --- Day 5: Alchemical Reduction ---
 You've managed to sneak in to the prototype suit manufacturing lab. The Elves are making decent progress, but are still struggling with the suit's size reduction capabilities.
@@ -51,21 +57,205 @@ class Polymer:
             self.can_react = False
 
 
-print("part1")
+def react_units(units: bytes, stack: Optional[bytearray] = None) -> bytearray:
+    """
+    React a sequence of units in a single pass.
+
+    Two ASCII letters of the same type and opposite polarity only differ by
+    the case bit, i.e. their XOR is 32.
+
+    Parameters
+    ----------
+    units : bytes
+        The units, as ASCII letters
+    stack : Optional[bytearray], optional
+        Already reacted units to continue from (the default is None)
+
+    Returns
+    -------
+    bytearray
+        The reacted units (the same object as `stack` if one is given)
+    """
+    if stack is None:
+        stack = bytearray()
+    for unit in units:
+        if stack and stack[-1] ^ unit == 32:
+            stack.pop()
+        else:
+            stack.append(unit)
+    return stack
+
+
+class StackPolymer(Polymer):
+    """A `Polymer` reacting in linear time, with a stack"""
+
+    def react(self):
+        self.config = react_units(self.config.encode("ascii")).decode("ascii")
+        self.can_react = False
+
+
+WHITESPACE = b" \t\r\n"
+
+
+def merge_reacted(left: bytearray, right: bytes) -> bytearray:
+    """
+    Concatenate two reacted polymers, reacting units at the boundary.
+
+    Parameters
+    ----------
+    left : bytearray
+        Reacted units, extended in place
+    right : bytes
+        Reacted units following `left`
+
+    Returns
+    -------
+    bytearray
+        `left`, now holding the reaction of left + right
+    """
+    i = 0
+    while left and i < len(right) and left[-1] ^ right[i] == 32:
+        left.pop()
+        i += 1
+    left += right[i:]
+    return left
+
+
+def react_stream(source: Optional[BinaryIO] = None, chunk_size: int = 1 << 16,
+                 output: Optional[BinaryIO] = None) -> int:
+    """
+    React a polymer read from a file or pipe, in bounded memory.
+
+    Only the stack of unreacted units is kept, so memory depends on the size
+    of the reacted polymer rather than on the input. Whitespace is ignored.
+
+    Parameters
+    ----------
+    source : Optional[BinaryIO], optional
+        File-like object to read the polymer from (the default is None,
+        which means stdin)
+    chunk_size : int, optional
+        Number of bytes read at a time (the default is 64 KiB)
+    output : Optional[BinaryIO], optional
+        File-like object the reacted polymer is written to (the default is
+        None, which means it is not written)
+
+    Returns
+    -------
+    int
+        Length of the reacted polymer
+    """
+    if source is None:
+        source = sys.stdin
+    # text streams (e.g. sys.stdin) expose their bytes through .buffer
+    source = getattr(source, "buffer", source)
+    stack = bytearray()
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        react_units(chunk.translate(None, WHITESPACE), stack)
+    if output is not None:
+        getattr(output, "buffer", output).write(stack)
+    return len(stack)
+
+
+def _react_chunk(chunk: Tuple[str, int, int]) -> bytes:
+    path, start, stop = chunk
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as units:
+            return bytes(react_units(units[start:stop].translate(None, WHITESPACE)))
+
+
+def react_file_parallel(path: str, chunk_size: int = 1 << 24,
+                        processes: Optional[int] = None) -> bytes:
+    """
+    React a polymer file too large to be handled in one go.
+
+    The memory-mapped file is cut in chunks reacted on separate cores, and
+    the reacted chunks are then merged pairwise, in a tree. Whitespace in the
+    file is ignored.
+
+    Parameters
+    ----------
+    path : str
+        Path to the polymer file
+    chunk_size : int, optional
+        Number of bytes reacted by a worker at a time (the default is 16 MiB)
+    processes : Optional[int], optional
+        Number of worker processes (the default is None, one per core)
+
+    Returns
+    -------
+    bytes
+        The reacted polymer
+    """
+    size = os.path.getsize(path)
+    chunks = [(path, start, min(start + chunk_size, size))
+              for start in range(0, size, chunk_size)]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        runs: List[bytes] = list(pool.map(_react_chunk, chunks))
+    while len(runs) > 1:
+        runs = [
+            bytes(merge_reacted(bytearray(runs[i]), runs[i + 1]))
+            if i + 1 < len(runs) else runs[i]
+            for i in range(0, len(runs), 2)
+        ]
+    return runs[0] if runs else b""
+
+
+def _removal_length(trial: Tuple[bytes, str]) -> int:
+    units, unit_type = trial
+    removed = units.translate(None, (unit_type + unit_type.upper()).encode())
+    return len(react_units(removed))
+
+
+def optimal_removal(polymer: str,
+                    processes: Optional[int] = None) -> Dict[str, int]:
+    """
+    Length of the fully reacted polymer after removing each unit type.
+
+    Removing a unit type never prevents a reaction that already happened, so
+    every trial starts from the reacted polymer rather than the raw one.
+
+    Parameters
+    ----------
+    polymer : str
+        The polymer
+    processes : Optional[int], optional
+        Number of worker processes running the 26 trials, 1 to run them in
+        this process (the default is None, one per core)
+
+    Returns
+    -------
+    Dict[str, int]
+        Reacted length for each removed unit type
+    """
+    units = bytes(react_units(polymer.encode("ascii")))
+    trials = [(units, unit_type) for unit_type in string.ascii_lowercase]
+    if processes == 1:
+        lengths = map(_removal_length, trials)
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            lengths = list(pool.map(_removal_length, trials))
+    return dict(zip(string.ascii_lowercase, lengths))
+
+
 polymer = Polymer(TEST)
 polymer.react()
 assert polymer.config == "dabCBAcaDA"
 assert len(polymer.config) == 10
-
-with open("data/day05.txt") as f:
-    lines = [line.strip() for line in f]
-assert len(lines) == 1
-INPUT = lines[0]
-polymer = Polymer(INPUT)
+polymer = StackPolymer(TEST)
+polymer.react()
+assert polymer.config == "dabCBAcaDA"
+polymer = StackPolymer("abBA")
 polymer.react()
-print(len(polymer.config))
+assert polymer.config == "" and polymer.can_react is False
+assert react_units(b"abBA") == b""
+reacted = io.BytesIO()
+assert react_stream(io.BytesIO(TEST.encode() + b"\n"), 3, reacted) == 10
+assert reacted.getvalue() == b"dabCBAcaDA"
 
-print("part2")
 lengths = []
 for a, A in zip(string.ascii_lowercase, string.ascii_uppercase):
     INPUT_MOD = TEST.replace(a, "").replace(A, "")
@@ -73,10 +263,26 @@ for a, A in zip(string.ascii_lowercase, string.ascii_uppercase):
     polymer.react()
     lengths.append(len(polymer.config))
 assert min(lengths) == 4
-lengths = []
-for a, A in zip(string.ascii_lowercase, string.ascii_uppercase):
-    INPUT_MOD = INPUT.replace(a, "").replace(A, "")
-    polymer = Polymer(INPUT_MOD)
+assert list(optimal_removal(TEST, processes=1).values()) == lengths
+
+if __name__ == "__main__":
+    # the pools of optimal_removal and react_file_parallel import this module
+    # again under spawn/forkserver: only react the real input as a script
+    with open("data/day05.txt") as f:
+        lines = [line.strip() for line in f]
+    assert len(lines) == 1
+    INPUT = lines[0]
+
+    print("part1")
+    polymer = StackPolymer(INPUT)
     polymer.react()
-    lengths.append(len(polymer.config))
-print(min(lengths))
+    print(len(polymer.config))
+
+    print("part2")
+    print(min(optimal_removal(INPUT).values()))
+
+    assert react_file_parallel("data/day05.txt", chunk_size=4096) == (
+        react_units(INPUT.encode("ascii"))
+    )
+    with open("data/day05.txt", "rb") as f:
+        assert react_stream(f) == len(react_units(INPUT.encode("ascii")))
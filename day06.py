@@ -1,8 +1,20 @@
-from typing import List
-from scipy.spatial import distance_matrix
-import pandas as pd
+import heapq
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
 import numpy as np
 
+try:
+    from scipy.spatial import cKDTree, distance_matrix
+except ImportError:
+    cKDTree = distance_matrix = None
+try:
+    # only needed by the original solve_part1 and solve_part2
+    import pandas as pd
+except ImportError:
+    pd = None
+
+MEMORY_BUDGET = 64 * 2**20
+
 """--- Day 6: Chronal Coordinates ---
 The device on your wrist beeps several times, and once again you feel like you're falling.
 
@@ -173,6 +185,446 @@ def solve_part2(input, threshold):
     return (total_distances < threshold).sum()
 
 
+def parse_zones(input: List[str]) -> np.ndarray:
+    """Coordinates of the centers of all zones, as an (n_zones, 2) int32 array"""
+    return np.array(
+        [[int(x) for x in line.split(", ")] for line in input], dtype=np.int32
+    ).reshape(-1, 2)
+
+
+def grid_shape(zones: np.ndarray) -> Tuple[int, int]:
+    """Shape of the grid used by the solvers, covering all zones plus a border"""
+    xmax, ymax = zones.max(axis=0)
+    return int(xmax) + 2, int(ymax) + 2
+
+
+def _bands(zones: np.ndarray, shape: Tuple[int, int], memory_budget: int):
+    """Yield rows of the grid, with the distances from every cell to every zone"""
+    width, height = shape
+    # int32 distances plus about as much again for temporaries
+    rows = max(1, memory_budget // (8 * height * max(len(zones), 1)))
+    dy = np.abs(np.arange(height, dtype=np.int32)[:, None] - zones[:, 1])
+    for x0 in range(0, width, rows):
+        x1 = min(x0 + rows, width)
+        dx = np.abs(np.arange(x0, x1, dtype=np.int32)[:, None] - zones[:, 0])
+        yield x0, x1, dx[:, None, :] + dy[None, :, :]
+
+
+def closest_zones(zones: np.ndarray, shape: Optional[Tuple[int, int]] = None,
+                  memory_budget: int = MEMORY_BUDGET
+                  ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Closest zone to every cell of the grid, computed in bands of rows.
+
+    Distances are int32 and only a band of rows is held in memory at a time,
+    its size bounded by `memory_budget`.
+
+    Parameters
+    ----------
+    zones : np.ndarray
+        (n_zones, 2) coordinates of the zones
+    shape : Optional[Tuple[int, int]], optional
+        Shape of the grid (the default is None, which means `grid_shape`)
+    memory_budget : int, optional
+        Approximate number of bytes used for distances (the default is
+        MEMORY_BUDGET)
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        Index of the closest zone for every cell (-1 for ties) and the
+        distance to it
+    """
+    if shape is None:
+        shape = grid_shape(zones)
+    labels = np.empty(shape, dtype=np.int32)
+    distances = np.empty(shape, dtype=np.int32)
+    for x0, x1, band in _bands(zones, shape, memory_budget):
+        closest = band.argmin(axis=-1)
+        distances[x0:x1] = np.take_along_axis(
+            band, closest[..., None], axis=-1
+        )[..., 0]
+        if band.shape[-1] > 1:
+            # a tie if the second smallest distance equals the smallest one
+            second = np.partition(band, 1, axis=-1)[..., 1]
+            closest[second == distances[x0:x1]] = -1
+        labels[x0:x1] = closest
+    return labels, distances
+
+
+def flood_fill_zones(zones: np.ndarray,
+                     shape: Optional[Tuple[int, int]] = None
+                     ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Closest zone to every cell of the grid, by a multi-source flood fill.
+
+    All zones grow one step at a time. A cell reached at step d is closest
+    to the zones of the neighbours it was reached from, so it is a tie as
+    soon as those neighbours disagree (or are ties themselves). Every cell is
+    visited once, whatever the number of zones.
+
+    Parameters
+    ----------
+    zones : np.ndarray
+        (n_zones, 2) coordinates of the zones, all inside the grid
+    shape : Optional[Tuple[int, int]], optional
+        Shape of the grid (the default is None, which means `grid_shape`)
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        Index of the closest zone for every cell (-1 for ties) and the
+        distance to it
+    """
+    if shape is None:
+        shape = grid_shape(zones)
+    width, height = shape
+    labels = np.full(width * height, -1, dtype=np.int32)
+    distances = np.full(width * height, -1, dtype=np.int32)
+
+    cells = zones[:, 0].astype(np.int64) * height + zones[:, 1]
+    frontier, first, counts = np.unique(
+        cells, return_index=True, return_counts=True
+    )
+    # several zones on the same cell are tied there
+    labels[frontier] = np.where(counts == 1, first, -1)
+    distances[frontier] = 0
+    step = 0
+    while len(frontier):
+        step += 1
+        x, y = np.divmod(frontier, height)
+        reached = np.concatenate([
+            frontier[x > 0] - height, frontier[x < width - 1] + height,
+            frontier[y > 0] - 1, frontier[y < height - 1] + 1,
+        ])
+        origin = np.concatenate([
+            labels[frontier[x > 0]], labels[frontier[x < width - 1]],
+            labels[frontier[y > 0]], labels[frontier[y < height - 1]],
+        ])
+        new = distances[reached] < 0
+        reached, origin = reached[new], origin[new]
+        if len(reached) == 0:
+            break
+        order = np.argsort(reached, kind="stable")
+        reached, origin = reached[order], origin[order]
+        starts = np.flatnonzero(np.r_[True, reached[1:] != reached[:-1]])
+        lowest = np.minimum.reduceat(origin, starts)
+        highest = np.maximum.reduceat(origin, starts)
+        frontier = reached[starts]
+        labels[frontier] = np.where(lowest == highest, lowest, -1)
+        distances[frontier] = step
+    return labels.reshape(shape), distances.reshape(shape)
+
+
+class ZoneIndex:
+    """
+    Closest zone to arbitrary locations, in logarithmic time per query.
+
+    Rotating the plane by 45 degrees (u = x + y, v = x - y) turns Manhattan
+    distances into Chebyshev distances, which a KD-tree handles directly.
+    Without scipy, queries fall back to a brute-force search in bands.
+    """
+
+    def __init__(self, zones: np.ndarray, leafsize: int = 16) -> None:
+        self.zones = np.asarray(zones, dtype=np.int64).reshape(-1, 2)
+        self._tree = None
+        if cKDTree is not None:
+            self._tree = cKDTree(self._rotate(self.zones), leafsize=leafsize)
+
+    @staticmethod
+    def _rotate(points: np.ndarray) -> np.ndarray:
+        return np.stack(
+            [points[:, 0] + points[:, 1], points[:, 0] - points[:, 1]], axis=1
+        )
+
+    def query(self, points: np.ndarray,
+              memory_budget: int = MEMORY_BUDGET
+              ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Closest zone to each of a batch of locations.
+
+        Parameters
+        ----------
+        points : np.ndarray
+            (n_points, 2) integer coordinates of the locations
+        memory_budget : int, optional
+            Approximate number of bytes used for distances by the fallback
+            search (the default is MEMORY_BUDGET)
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray]
+            Index of the closest zone to each location (-1 for ties) and the
+            distance to it
+        """
+        points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+        k = min(2, len(self.zones))
+        if self._tree is not None:
+            distances, closest = self._tree.query(
+                self._rotate(points), k=k, p=np.inf
+            )
+            distances = np.rint(distances).astype(np.int64).reshape(-1, k)
+            closest = closest.reshape(-1, k)
+        else:
+            rows = max(1, memory_budget // (16 * len(self.zones)))
+            distances = np.empty((len(points), k), dtype=np.int64)
+            closest = np.empty((len(points), k), dtype=np.int64)
+            for i in range(0, len(points), rows):
+                chunk = np.abs(
+                    points[i:i + rows, None, :] - self.zones[None, :, :]
+                ).sum(axis=-1)
+                nearest = np.argsort(chunk, axis=-1, kind="stable")[:, :k]
+                closest[i:i + rows] = nearest
+                distances[i:i + rows] = np.take_along_axis(chunk, nearest, -1)
+        labels = closest[:, 0].astype(np.int32)
+        if k > 1:
+            labels[distances[:, 1] == distances[:, 0]] = -1
+        return labels, distances[:, 0]
+
+
+class VoronoiGrid:
+    """
+    Label grid kept up to date while zones are added and removed.
+
+    An update only visits the cells whose closest zone may change: the cells
+    at least as close to a new zone as to their current one, or the cells
+    that were closest (or tied) to a removed zone. Zone areas and the set of
+    infinite zones are maintained along the way.
+    """
+
+    FAR = np.iinfo(np.int32).max
+
+    def __init__(self, zones: np.ndarray,
+                 shape: Optional[Tuple[int, int]] = None) -> None:
+        zones = np.asarray(zones, dtype=np.int32).reshape(-1, 2)
+        if shape is None:
+            shape = grid_shape(zones)
+        self.shape = shape
+        self.zones: Dict[int, Tuple[int, int]] = {
+            i: (int(x), int(y)) for i, (x, y) in enumerate(zones)
+        }
+        self._next_id = len(zones)
+        self.labels, self.distances = flood_fill_zones(zones, shape)
+        self.distances[self.distances < 0] = self.FAR
+        counts = np.bincount(self.labels[self.labels >= 0],
+                             minlength=len(zones))
+        self.areas: Dict[int, int] = {i: int(n) for i, n in enumerate(counts)}
+        self._on_border = np.zeros(shape, dtype=bool)
+        self._on_border[[0, -1], :] = self._on_border[:, [0, -1]] = True
+        border = self.labels[self._on_border]
+        counts = np.bincount(border[border >= 0], minlength=len(zones))
+        self._border_cells: Dict[int, int] = {
+            i: int(n) for i, n in enumerate(counts)
+        }
+
+    @property
+    def infinite(self) -> Set[int]:
+        """Zones touching the border of the grid"""
+        return {zone for zone, n in self._border_cells.items() if n > 0}
+
+    def largest_finite_area(self) -> int:
+        infinite = self.infinite
+        return max(
+            (n for zone, n in self.areas.items() if zone not in infinite),
+            default=0,
+        )
+
+    def _neighbours(self, x: int, y: int) -> List[Tuple[int, int]]:
+        width, height = self.shape
+        return [(a, b) for a, b in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1))
+                if 0 <= a < width and 0 <= b < height]
+
+    def _relabel(self, cell: Tuple[int, int], label: int, distance: int) -> None:
+        old = int(self.labels[cell])
+        if old >= 0:
+            self.areas[old] -= 1
+            if self._on_border[cell]:
+                self._border_cells[old] -= 1
+        if label >= 0:
+            self.areas[label] += 1
+            if self._on_border[cell]:
+                self._border_cells[label] += 1
+        self.labels[cell] = label
+        self.distances[cell] = distance
+
+    def insert(self, x: int, y: int) -> int:
+        """Add a zone centered on (x, y), return its id"""
+        if not (0 <= x < self.shape[0] and 0 <= y < self.shape[1]):
+            raise ValueError(f"zone ({x}, {y}) is outside the grid")
+        zone = self._next_id
+        self._next_id += 1
+        self.zones[zone] = (x, y)
+        self.areas[zone] = 0
+        self._border_cells[zone] = 0
+        # the cells at least as close to the new zone form a connected region
+        queue = deque([(x, y)])
+        seen = {(x, y)}
+        while queue:
+            cell = queue.popleft()
+            distance = abs(cell[0] - x) + abs(cell[1] - y)
+            current = int(self.distances[cell])
+            if distance > current:
+                continue
+            self._relabel(cell, zone if distance < current else -1, distance)
+            for neighbour in self._neighbours(*cell):
+                if neighbour not in seen:
+                    seen.add(neighbour)
+                    queue.append(neighbour)
+        return zone
+
+    def remove(self, zone: int) -> None:
+        """Remove a zone, relabelling the cells it was closest to"""
+        x, y = self.zones.pop(zone)
+        # the cells for which the zone was among the closest ones
+        affected = {(x, y)}
+        queue = deque([(x, y)])
+        while queue:
+            cell = queue.popleft()
+            for neighbour in self._neighbours(*cell):
+                if (neighbour not in affected and self.distances[neighbour]
+                        == abs(neighbour[0] - x) + abs(neighbour[1] - y)):
+                    affected.add(neighbour)
+                    queue.append(neighbour)
+        for cell in affected:
+            self._relabel(cell, -1, self.FAR)
+        del self.areas[zone]
+        del self._border_cells[zone]
+
+        # grow the remaining zones back into the affected cells, one distance
+        # at a time so that ties are known before a cell is propagated
+        heap = [(0, self.zones[other], other) for other in self.zones
+                if self.zones[other] in affected]
+        for cell in affected:
+            for neighbour in self._neighbours(*cell):
+                if (neighbour not in affected
+                        and self.distances[neighbour] < self.FAR):
+                    heap.append((int(self.distances[neighbour]) + 1, cell,
+                                 int(self.labels[neighbour])))
+        heapq.heapify(heap)
+        while heap:
+            distance = heap[0][0]
+            reached = {}
+            while heap and heap[0][0] == distance:
+                _, cell, label = heapq.heappop(heap)
+                if self.distances[cell] < self.FAR:
+                    continue
+                if reached.get(cell, label) != label:
+                    label = -1
+                reached[cell] = label
+            for cell, label in reached.items():
+                self._relabel(cell, label, distance)
+            for cell, label in reached.items():
+                for neighbour in self._neighbours(*cell):
+                    if (neighbour in affected
+                            and self.distances[neighbour] == self.FAR):
+                        heapq.heappush(heap, (distance + 1, neighbour, label))
+
+
+def total_distances(zones: np.ndarray, shape: Optional[Tuple[int, int]] = None,
+                    memory_budget: int = MEMORY_BUDGET) -> np.ndarray:
+    """Sum of the distances from every cell of the grid to all zones"""
+    if shape is None:
+        shape = grid_shape(zones)
+    totals = np.empty(shape, dtype=np.int64)
+    for x0, x1, band in _bands(zones, shape, memory_budget):
+        totals[x0:x1] = band.sum(axis=-1, dtype=np.int64)
+    return totals
+
+
+def area_statistics(labels: np.ndarray,
+                    n_zones: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Area of every zone, and which zones are infinite, from a label grid.
+
+    Parameters
+    ----------
+    labels : np.ndarray
+        Index of the closest zone for every cell (-1 for ties)
+    n_zones : int
+        Number of zones
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        Number of cells of each zone, and the sorted indices of the zones
+        touching the border of the grid
+    """
+    areas = np.bincount(labels[labels >= 0], minlength=n_zones)
+    border = np.unique(np.concatenate(
+        [labels[0], labels[-1], labels[:, 0], labels[:, -1]]
+    ))
+    return areas, border[border >= 0]
+
+
+def largest_finite_area(labels: np.ndarray, n_zones: int) -> int:
+    """Size of the largest area that does not touch the border of the grid"""
+    areas, infinite = area_statistics(labels, n_zones)
+    areas[infinite] = 0
+    return int(areas.max())
+
+
+def solve_part1_banded(input: List[str],
+                       memory_budget: int = MEMORY_BUDGET) -> int:
+    """Same as `solve_part1`, without pandas and in bounded memory"""
+    zones = parse_zones(input)
+    labels, _ = closest_zones(zones, memory_budget=memory_budget)
+    return largest_finite_area(labels, len(zones))
+
+
+def _cost_profile(coords: np.ndarray, lo: int, hi: int) -> np.ndarray:
+    """Sum of |p - c| over coords, for every integer p in [lo, hi]"""
+    coords = np.sort(coords.astype(np.int64))
+    prefix = np.concatenate(([0], np.cumsum(coords)))
+    positions = np.arange(lo, hi + 1, dtype=np.int64)
+    below = np.searchsorted(coords, positions, side="right")
+    return (positions * below - prefix[below]
+            + (prefix[-1] - prefix[below]) - positions * (len(coords) - below))
+
+
+def safe_region_size(zones: np.ndarray, threshold: int) -> int:
+    """
+    Number of locations whose total distance to all zones is below threshold.
+
+    The total distance splits into a cost along x plus a cost along y, each
+    computed once per row or column with prefix sums. Locations outside the
+    grid are counted too: the profiles extend as far as the threshold allows.
+
+    Parameters
+    ----------
+    zones : np.ndarray
+        (n_zones, 2) coordinates of the zones
+    threshold : int
+        Total distance that must not be reached
+
+    Returns
+    -------
+    int
+        Size of the safe region
+    """
+    # beyond this margin, the cost along a single axis reaches the threshold
+    margin = threshold // len(zones) + 1
+    costs = [
+        _cost_profile(zones[:, axis], int(zones[:, axis].min()) - margin,
+                      int(zones[:, axis].max()) + margin)
+        for axis in (0, 1)
+    ]
+    cost_y = np.sort(costs[1])
+    return int(np.searchsorted(cost_y, threshold - costs[0], side="left").sum())
+
+
+def solve_part2_separable(input: List[str], threshold: int) -> int:
+    """Same as `solve_part2`, including locations outside the grid"""
+    return safe_region_size(parse_zones(input), threshold)
+
+
+def solve_part2_banded(input: List[str], threshold: int,
+                       memory_budget: int = MEMORY_BUDGET) -> int:
+    """Same as `solve_part2`, without pandas and in bounded memory"""
+    zones = parse_zones(input)
+    return int((total_distances(zones, memory_budget=memory_budget)
+                < threshold).sum())
+
+
 TEST = [
     "1, 1",
     "1, 6",
@@ -182,14 +634,54 @@ TEST = [
     "8, 9"
 ]
 
+labels, _ = closest_zones(parse_zones(TEST), memory_budget=256)
+assert labels[5, 5] == 4 and labels[0, 4] == -1 and labels[1, 1] == 0
+assert solve_part2_banded(TEST, 32, memory_budget=256) == 16
+assert solve_part1_banded(TEST, memory_budget=256) == 17
+assert all((a == b).all() for a, b in zip(
+    flood_fill_zones(parse_zones(TEST)), closest_zones(parse_zones(TEST))
+))
+assert flood_fill_zones(np.array([[1, 1], [1, 1], [3, 1]]))[0][1, 1] == -1
+assert solve_part2_separable(TEST, 32) == 16
+voronoi = VoronoiGrid(parse_zones(TEST))
+assert voronoi.largest_finite_area() == 17
+assert voronoi.infinite == {0, 1, 2, 5}
+voronoi.remove(4)
+voronoi.insert(5, 5)
+assert voronoi.largest_finite_area() == 17 and voronoi.areas[6] == 17
+# a single zone: a diamond of radius 9, partly outside the grid
+assert solve_part2_separable(["0, 0"], 10) == 2 * 9 * 10 + 1
+areas, infinite = area_statistics(labels, len(TEST))
+assert list(areas[[3, 4]]) == [9, 17] and list(infinite) == [0, 1, 2, 5]
+
 print("test case:")
-print("part 1:", solve_part1(TEST))
-print("part 2:", solve_part2(TEST, 32))
+if pd is not None and distance_matrix is not None:
+    assert solve_part1(TEST) == solve_part1_banded(TEST)
+    assert solve_part2(TEST, 32) == solve_part2_banded(TEST, 32)
+print("part 1:", solve_part1_banded(TEST))
+print("part 2:", solve_part2_separable(TEST, 32))
 print()
 
 with open("data/day06.txt") as f:
     REAL = [line.strip() for line in f]
 
+labels, distances = flood_fill_zones(parse_zones(REAL))
+assert (labels == closest_zones(parse_zones(REAL))[0]).all()
+
+index = ZoneIndex(parse_zones(REAL))
+cells = np.argwhere(np.ones(labels.shape, dtype=bool))
+assert (index.query(cells)[0] == labels.reshape(-1)).all()
+assert (index.query(cells)[1] == distances.reshape(-1)).all()
+
+voronoi = VoronoiGrid(parse_zones(REAL))
+assert voronoi.largest_finite_area() == largest_finite_area(labels, len(REAL))
+zone = voronoi.insert(200, 200)
+voronoi.remove(zone)
+assert (voronoi.labels == labels).all() and (voronoi.distances == distances).all()
+
 print("real case:")
-print("part 1:", solve_part1(REAL))
-print("part 2:", solve_part2(REAL, 10_000))
+if pd is not None and distance_matrix is not None:
+    assert solve_part1(REAL) == solve_part1_banded(REAL)
+    assert solve_part2(REAL, 10_000) == solve_part2_banded(REAL, 10_000)
+print("part 1:", solve_part1_banded(REAL))
+print("part 2:", solve_part2_separable(REAL, 10_000))